@@ -1,18 +1,28 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from typing import List, Optional
+from contextlib import asynccontextmanager
 import uvicorn
 
 from ..config.settings import settings
-from ..models.prediction import DeliveryPrediction
+from ..models.prediction import DeliveryPrediction, DeliveryStatusUpdate
 from ..services.sap_service import SAPService
+from ..services.writeback_service import DeliveryStatusWriteBackQueue
 from ..services.prediction_service import PredictionService
 from ..services.external_service import ExternalDataService
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Run the SAP write-back flusher for the lifetime of the app
+    writeback_queue.start()
+    yield
+    await writeback_queue.stop()
+
 app = FastAPI(
     title=settings.APP_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -31,6 +41,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 sap_service = SAPService()
 prediction_service = PredictionService()
 external_service = ExternalDataService()
+writeback_queue = DeliveryStatusWriteBackQueue(sap_service)
 
 @app.get("/")
 async def root():
@@ -70,6 +81,47 @@ async def get_delivery_predictions(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/deliveries/{delivery_id}/status", status_code=202)
+def update_delivery_status(
+    delivery_id: str,
+    status: str,
+    token: str = Depends(oauth2_scheme)
+):
+    try:
+        # Queue for batched write-back to SAP; plain def keeps the SQLite
+        # write in FastAPI's threadpool instead of on the event loop
+        return writeback_queue.enqueue(delivery_id, status)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/v1/deliveries/status", status_code=202)
+def update_delivery_statuses(
+    updates: List[DeliveryStatusUpdate],
+    token: str = Depends(oauth2_scheme)
+):
+    try:
+        return writeback_queue.enqueue_many([update.model_dump() for update in updates])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/v1/deliveries/status/queue")
+def get_writeback_queue_stats(token: str = Depends(oauth2_scheme)):
+    return {
+        **writeback_queue.get_stats(),
+        "failed_updates": writeback_queue.get_failed_updates()
+    }
+
+@app.post("/api/v1/deliveries/status/queue/requeue")
+def requeue_failed_updates(
+    delivery_ids: Optional[List[str]] = Body(None),
+    token: str = Depends(oauth2_scheme)
+):
+    try:
+        # Retry dead-lettered updates, all of them if no IDs are given
+        return {"requeued": writeback_queue.requeue_failed(delivery_ids)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/v1/alerts/configure")
 async def configure_alerts(
     threshold: float,
@@ -17,6 +17,7 @@ class Settings(BaseSettings):
     SAP_CLIENT: str = os.getenv("SAP_CLIENT", "100")
     SAP_USER: str = os.getenv("SAP_USER", "")
     SAP_PASSWD: str = os.getenv("SAP_PASSWD", "")
+    SAP_POOL_SIZE: int = int(os.getenv("SAP_POOL_SIZE", "4"))
 
     # Database Settings
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./app.db")
@@ -34,6 +35,16 @@ class Settings(BaseSettings):
     MODEL_PATH: str = "models/supplier_delay_prediction.pkl"
     RETRAIN_SCHEDULE_HOURS: int = 24
 
+    # SAP Write-back Queue Settings
+    WRITEBACK_QUEUE_PATH: str = os.getenv("WRITEBACK_QUEUE_PATH", "./writeback_queue.db")
+    WRITEBACK_BATCH_SIZE: int = 200
+    WRITEBACK_FLUSH_INTERVAL_SECONDS: float = 5.0
+    WRITEBACK_MAX_RETRIES: int = 10
+    WRITEBACK_BACKOFF_BASE_SECONDS: float = 2.0
+    WRITEBACK_BACKOFF_MAX_SECONDS: float = 300.0
+    WRITEBACK_CLAIM_TIMEOUT_SECONDS: float = 600.0
+    WRITEBACK_DB_TIMEOUT_SECONDS: float = 5.0
+
     # Alert Settings
     ALERT_THRESHOLD_PROBABILITY: float = 0.7
     NOTIFICATION_EMAIL: Optional[str] = os.getenv("NOTIFICATION_EMAIL")
@@ -31,4 +31,8 @@ class PredictionResult(BaseModel):
     predictions: List[DeliveryPrediction]
     generated_at: datetime
     model_version: str
-    recommendations: List[str] 
\ No newline at end of file
+    recommendations: List[str] 
+
+class DeliveryStatusUpdate(BaseModel):
+    delivery_id: str
+    status: str
@@ -1,10 +1,77 @@
-from pyrfc import Connection
+from pyrfc import Connection, CommunicationError
 from typing import List, Optional, Dict
 import pandas as pd
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 from ..config.settings import settings
 
+class SAPConnectionPool:
+    """Thread-safe pool of reusable SAP RFC connections"""
+
+    def __init__(self, connection_params: Dict, size: int):
+        self.connection_params = connection_params
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._invalid = set()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, discarding it if the caller raises or invalidates it"""
+        self._slots.acquire()
+        try:
+            conn = self._checkout()
+            try:
+                yield conn
+            except Exception:
+                self._invalid.discard(id(conn))
+                self._discard(conn)
+                raise
+            else:
+                if id(conn) in self._invalid:
+                    self._invalid.discard(id(conn))
+                    self._discard(conn)
+                else:
+                    self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def invalidate(self, conn: Connection):
+        """Mark a borrowed connection as broken so it is not reused"""
+        self._invalid.add(id(conn))
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def _checkout(self) -> Connection:
+        """Reuse an idle connection that still answers a ping, else open a new one"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return Connection(**self.connection_params)
+
+            try:
+                conn.ping()
+                return conn
+            except Exception:
+                self._discard(conn)
+
+    @staticmethod
+    def _discard(conn: Connection):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
 class SAPService:
     def __init__(self):
         self.connection_params = {
@@ -14,6 +81,7 @@ class SAPService:
             'user': settings.SAP_USER,
             'passwd': settings.SAP_PASSWD
         }
+        self.pool = SAPConnectionPool(self.connection_params, settings.SAP_POOL_SIZE)
 
     async def connect(self) -> Connection:
         """Establish connection to SAP system"""
@@ -100,23 +168,46 @@ class SAPService:
         """Update delivery status in SAP"""
         try:
             conn = await self.connect()
-            
-            # Define the RFC function module name
-            function_name = 'BAPI_DELIVERY_CHANGE'
-            
-            # Call the RFC function module
-            result = conn.call(
-                function_name,
-                DELIVERY=delivery_id,
-                DELIVERY_STATUS=status
-            )
-            
+            success = self.change_delivery_status(conn, delivery_id, status)
             conn.close()
-            return result['RETURN']['TYPE'] == 'S'  # Success
+            return success
         
         except Exception as e:
             raise Exception(f"Failed to update delivery status: {str(e)}")
 
+    def update_delivery_statuses(self, updates: List[Dict]) -> Dict[str, Optional[str]]:
+        """Push a batch of status updates to SAP over one pooled connection"""
+        results = {}
+        with self.pool.connection() as conn:
+            for update in updates:
+                try:
+                    if self.change_delivery_status(conn, update['delivery_id'], update['status']):
+                        results[update['delivery_id']] = None
+                    else:
+                        results[update['delivery_id']] = "SAP rejected status change"
+                except CommunicationError as e:
+                    # Drop the connection; later updates are left out as unsent
+                    results[update['delivery_id']] = str(e)
+                    self.pool.invalidate(conn)
+                    break
+                except Exception as e:
+                    results[update['delivery_id']] = str(e)
+        return results
+
+    def change_delivery_status(self, conn: Connection, delivery_id: str, status: str) -> bool:
+        """Call BAPI_DELIVERY_CHANGE on an open connection"""
+        # Define the RFC function module name
+        function_name = 'BAPI_DELIVERY_CHANGE'
+        
+        # Call the RFC function module
+        result = conn.call(
+            function_name,
+            DELIVERY=delivery_id,
+            DELIVERY_STATUS=status
+        )
+        
+        return result['RETURN']['TYPE'] == 'S'  # Success
+
     async def get_delivery_routes(self, delivery_ids: List[str]) -> List[Dict]:
         """Fetch delivery route information"""
         try:
@@ -0,0 +1,363 @@
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Dict
+
+from ..config.settings import settings
+from .sap_service import SAPService
+
+class DeliveryStatusWriteBackQueue:
+    """Durable local queue that batches delivery status updates back to SAP"""
+
+    def __init__(self, sap_service: SAPService, path: Optional[str] = None):
+        self.sap_service = sap_service
+        self.path = path or settings.WRITEBACK_QUEUE_PATH
+        self.batch_size = settings.WRITEBACK_BATCH_SIZE
+        self.flush_interval = settings.WRITEBACK_FLUSH_INTERVAL_SECONDS
+        self.max_retries = settings.WRITEBACK_MAX_RETRIES
+        self.backoff_base = settings.WRITEBACK_BACKOFF_BASE_SECONDS
+        self.backoff_max = settings.WRITEBACK_BACKOFF_MAX_SECONDS
+        self.claim_timeout = settings.WRITEBACK_CLAIM_TIMEOUT_SECONDS
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.path,
+            timeout=settings.WRITEBACK_DB_TIMEOUT_SECONDS,
+            check_same_thread=False
+        )
+        self._db.row_factory = sqlite3.Row
+        self._init_db()
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=sap_service.pool.size,
+            thread_name_prefix="sap-writeback"
+        )
+        self._task = None
+        self._loop = None
+        self._wakeup = None
+        self._stop = None
+        self._outages = 0
+        self._last_flush_at = None
+        self._last_flush_error = None
+
+    def _init_db(self):
+        """Create the queue table if needed"""
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS delivery_status_updates (
+                    delivery_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 1,
+                    queued_at TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    claimed_by TEXT,
+                    claimed_until REAL NOT NULL DEFAULT 0
+                )
+            """)
+            self._db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_delivery_status_updates_due
+                ON delivery_status_updates (failed, next_attempt_at)
+            """)
+
+    def enqueue(self, delivery_id: str, status: str) -> Dict:
+        """Queue a status update and return an acknowledgement"""
+        return self.enqueue_many([{'delivery_id': delivery_id, 'status': status}])[0]
+
+    def enqueue_many(self, updates: List[Dict]) -> List[Dict]:
+        """Queue several status updates in one transaction"""
+        queued_at = datetime.now().isoformat()
+        now = time.time()
+        acks = []
+
+        with self._lock, self._db:
+            for update in updates:
+                existing = self._db.execute(
+                    "SELECT failed FROM delivery_status_updates WHERE delivery_id = ?",
+                    (update['delivery_id'],)
+                ).fetchone()
+
+                # A newer status supersedes whatever is pending or dead-lettered
+                self._db.execute("""
+                    INSERT INTO delivery_status_updates
+                        (delivery_id, status, queued_at, next_attempt_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(delivery_id) DO UPDATE SET
+                        status = excluded.status,
+                        version = version + 1,
+                        queued_at = excluded.queued_at,
+                        attempts = 0,
+                        next_attempt_at = excluded.next_attempt_at,
+                        last_error = NULL,
+                        failed = 0
+                """, (update['delivery_id'], update['status'], queued_at, now))
+
+                acks.append({
+                    'delivery_id': update['delivery_id'],
+                    'status': update['status'],
+                    'queued_at': queued_at,
+                    'coalesced': existing is not None and not existing['failed']
+                })
+
+        # Called from request threads, so wake the flusher thread-safely
+        if self._wakeup is not None and self.pending_count() >= self.batch_size:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+        return acks
+
+    def pending_count(self) -> int:
+        """Number of updates waiting to be sent"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM delivery_status_updates WHERE failed = 0"
+            ).fetchone()
+        return row[0]
+
+    def get_stats(self) -> Dict:
+        """Summary of queue state"""
+        with self._lock:
+            row = self._db.execute("""
+                SELECT
+                    COALESCE(SUM(CASE WHEN failed = 0 THEN 1 ELSE 0 END), 0) AS pending,
+                    COALESCE(SUM(CASE WHEN failed = 0 AND attempts > 0 THEN 1 ELSE 0 END), 0) AS retrying,
+                    COALESCE(SUM(failed), 0) AS failed
+                FROM delivery_status_updates
+            """).fetchone()
+        return {
+            'pending': row['pending'],
+            'retrying': row['retrying'],
+            'failed': row['failed'],
+            'running': self._task is not None and not self._task.done(),
+            'last_flush_at': self._last_flush_at,
+            'last_flush_error': self._last_flush_error
+        }
+
+    def get_failed_updates(self) -> List[Dict]:
+        """Updates that exhausted their retries"""
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT delivery_id, status, queued_at, attempts, last_error
+                FROM delivery_status_updates
+                WHERE failed = 1
+                ORDER BY queued_at
+            """).fetchall()
+        return [dict(row) for row in rows]
+
+    async def flush(self) -> Dict:
+        """Send one batch of due updates to SAP"""
+        claim = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+
+        # SQLite may wait on another process's write lock; keep it off the loop
+        rows = await loop.run_in_executor(None, self._claim_due, claim)
+        if not rows:
+            return self._flush_result()
+
+        # One chunk per pooled connection
+        workers = min(self.sap_service.pool.size, len(rows))
+        chunks = [rows[i::workers] for i in range(workers)]
+
+        outcomes = await asyncio.gather(*[
+            loop.run_in_executor(
+                self._executor,
+                self.sap_service.update_delivery_statuses,
+                [{'delivery_id': row['delivery_id'], 'status': row['status']} for row in chunk]
+            )
+            for chunk in chunks
+        ], return_exceptions=True)
+
+        return await loop.run_in_executor(None, self._record_outcomes, claim, chunks, outcomes)
+
+    def _claim_due(self, claim: str) -> List[sqlite3.Row]:
+        """Claim due rows under a write lock so other processes skip them"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute("""
+                    SELECT delivery_id, status, version, attempts
+                    FROM delivery_status_updates
+                    WHERE failed = 0 AND next_attempt_at <= ? AND claimed_until <= ?
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                """, (now, now, self.batch_size)).fetchall()
+                self._db.executemany("""
+                    UPDATE delivery_status_updates
+                    SET claimed_by = ?, claimed_until = ?
+                    WHERE delivery_id = ?
+                """, [(claim, now + self.claim_timeout, row['delivery_id']) for row in rows])
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+        return rows
+
+    def _record_outcomes(self, claim: str, chunks: List[List[sqlite3.Row]], outcomes: List) -> Dict:
+        """Write batch results back to the queue and release the claim"""
+        succeeded = 0
+        failed = 0
+        unavailable = 0
+        error = None
+        now = time.time()
+
+        with self._lock, self._db:
+            for chunk, outcome in zip(chunks, outcomes):
+                # No connection could be opened; leave the chunk pending and
+                # let the flusher back off instead of charging attempts
+                if isinstance(outcome, BaseException):
+                    unavailable += len(chunk)
+                    error = f"Failed to connect to SAP: {str(outcome)}"
+                    continue
+
+                for row in chunk:
+                    # Never sent; leave it pending without charging an attempt
+                    if row['delivery_id'] not in outcome:
+                        continue
+
+                    # Version guard: leave rows that were re-queued mid-flight
+                    if outcome[row['delivery_id']] is None:
+                        succeeded += 1
+                        self._db.execute(
+                            "DELETE FROM delivery_status_updates WHERE delivery_id = ? AND version = ?",
+                            (row['delivery_id'], row['version'])
+                        )
+                    else:
+                        failed += 1
+                        attempts = row['attempts'] + 1
+                        self._db.execute("""
+                            UPDATE delivery_status_updates
+                            SET attempts = ?, next_attempt_at = ?, last_error = ?, failed = ?
+                            WHERE delivery_id = ? AND version = ?
+                        """, (
+                            attempts,
+                            now + self._backoff(attempts),
+                            outcome[row['delivery_id']],
+                            int(attempts >= self.max_retries),
+                            row['delivery_id'],
+                            row['version']
+                        ))
+
+            # Release whatever this flush still holds, including re-queued rows
+            self._db.execute("""
+                UPDATE delivery_status_updates
+                SET claimed_by = NULL, claimed_until = 0
+                WHERE claimed_by = ?
+            """, (claim,))
+
+        batched = sum(len(chunk) for chunk in chunks)
+        return self._flush_result(batched, succeeded, failed, unavailable, error)
+
+    @staticmethod
+    def _flush_result(batched: int = 0, succeeded: int = 0, failed: int = 0,
+                      unavailable: int = 0, error: Optional[str] = None) -> Dict:
+        return {
+            'batched': batched,
+            'sent': succeeded + failed,
+            'succeeded': succeeded,
+            'failed': failed,
+            'unavailable': unavailable,
+            'error': error
+        }
+
+    def requeue_failed(self, delivery_ids: Optional[List[str]] = None) -> int:
+        """Move dead-lettered updates back to pending"""
+        query = """
+            UPDATE delivery_status_updates
+            SET failed = 0, attempts = 0, last_error = NULL, next_attempt_at = ?
+            WHERE failed = 1
+        """
+        params = [time.time()]
+        if delivery_ids is not None:
+            query += f" AND delivery_id IN ({','.join('?' * len(delivery_ids))})"
+            params.extend(delivery_ids)
+
+        with self._lock, self._db:
+            count = self._db.execute(query, params).rowcount
+        return count
+
+    def _backoff(self, attempts: int) -> float:
+        """Exponential backoff with jitter"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay + random.uniform(0, delay * 0.1)
+
+    async def _flush_and_record(self) -> Dict:
+        """Flush once, keeping the outcome for get_stats"""
+        self._last_flush_at = datetime.now().isoformat()
+        try:
+            result = await self.flush()
+        except Exception as e:
+            self._last_flush_error = {
+                'error': f"{type(e).__name__}: {str(e)}",
+                'at': self._last_flush_at
+            }
+            return self._flush_result()
+
+        if result['error']:
+            self._last_flush_error = {'error': result['error'], 'at': self._last_flush_at}
+        else:
+            self._last_flush_error = None
+        return result
+
+    async def _run(self):
+        """Flush continuously, draining full batches before sleeping"""
+        while not self._stop.is_set():
+            result = await self._flush_and_record()
+
+            # SAP unreachable: back off the whole flusher, not the updates
+            if result['unavailable']:
+                self._outages += 1
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=self._backoff(self._outages))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._outages = 0
+            if result['batched'] >= self.batch_size:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        """Start the background flush task on the running event loop"""
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._stop = asyncio.Event()
+            self._wakeup = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task, sending anything already due"""
+        # Let any in-flight batch finish rather than abandoning its RFC calls
+        if self._task is not None:
+            self._stop.set()
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._wakeup = None
+
+        while True:
+            result = await self._flush_and_record()
+            if result['unavailable'] or result['batched'] < self.batch_size:
+                break
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown)
+        await loop.run_in_executor(None, self.sap_service.pool.close)
+        await loop.run_in_executor(None, self._close_db)
+
+    def _close_db(self):
+        with self._lock:
+            self._db.close()
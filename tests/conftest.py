@@ -0,0 +1,79 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# pyrfc needs the SAP NW RFC SDK; tests only use a fake Connection
+try:
+    import pyrfc
+except ImportError:
+    pyrfc = types.ModuleType("pyrfc")
+
+    class CommunicationError(Exception):
+        pass
+
+    class Connection:
+        def __init__(self, **params):
+            raise CommunicationError("pyrfc is not installed")
+
+    pyrfc.CommunicationError = CommunicationError
+    pyrfc.Connection = Connection
+    sys.modules["pyrfc"] = pyrfc
+
+from src.config.settings import settings
+from src.services import sap_service as sap_module
+
+
+class FakeConnection:
+    """Stand-in for pyrfc.Connection that routes BAPI calls to a FakeSAP"""
+
+    def __init__(self, sap):
+        self.sap = sap
+        self.closed = False
+        self.stale = False
+
+    def call(self, function_name, DELIVERY, DELIVERY_STATUS):
+        self.sap.calls.append((DELIVERY, DELIVERY_STATUS))
+        return {'RETURN': {'TYPE': self.sap.handler(DELIVERY, DELIVERY_STATUS)}}
+
+    def ping(self):
+        if self.stale:
+            raise sap_module.CommunicationError("connection is stale")
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSAP:
+    """Records BAPI calls; handler returns the SAP RETURN type or raises"""
+
+    def __init__(self):
+        self.calls = []
+        self.connections = []
+        self.handler = lambda delivery_id, status: 'S'
+
+    def connect(self, **params):
+        conn = FakeConnection(self)
+        self.connections.append(conn)
+        return conn
+
+
+@pytest.fixture
+def fake_sap(monkeypatch):
+    sap = FakeSAP()
+    monkeypatch.setattr(sap_module, "Connection", sap.connect)
+    return sap
+
+
+@pytest.fixture
+def writeback_settings(monkeypatch):
+    monkeypatch.setattr(settings, "SAP_POOL_SIZE", 2)
+    monkeypatch.setattr(settings, "WRITEBACK_BATCH_SIZE", 50)
+    monkeypatch.setattr(settings, "WRITEBACK_FLUSH_INTERVAL_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "WRITEBACK_MAX_RETRIES", 3)
+    monkeypatch.setattr(settings, "WRITEBACK_BACKOFF_BASE_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "WRITEBACK_BACKOFF_MAX_SECONDS", 0.0)
+    return settings
@@ -0,0 +1,81 @@
+import pytest
+
+from src.services.sap_service import SAPConnectionPool, SAPService, CommunicationError
+
+
+def test_pool_reuses_healthy_connection(fake_sap):
+    pool = SAPConnectionPool({}, size=1)
+
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert not first.closed
+    assert len(fake_sap.connections) == 1
+
+
+def test_pool_discards_connection_when_caller_raises(fake_sap):
+    pool = SAPConnectionPool({}, size=1)
+
+    with pytest.raises(RuntimeError):
+        with pool.connection() as broken:
+            raise RuntimeError("boom")
+
+    with pool.connection() as conn:
+        pass
+
+    assert broken.closed
+    assert conn is not broken
+
+
+def test_pool_discards_invalidated_connection(fake_sap):
+    pool = SAPConnectionPool({}, size=1)
+
+    with pool.connection() as broken:
+        pool.invalidate(broken)
+
+    with pool.connection() as conn:
+        pass
+
+    assert broken.closed
+    assert conn is not broken
+
+
+def test_pool_replaces_stale_idle_connection(fake_sap):
+    pool = SAPConnectionPool({}, size=1)
+
+    with pool.connection() as stale:
+        pass
+    stale.stale = True
+
+    with pool.connection() as conn:
+        pass
+
+    assert stale.closed
+    assert conn is not stale
+
+
+def test_update_delivery_statuses_stops_at_communication_error(fake_sap, writeback_settings):
+    def handler(delivery_id, status):
+        if delivery_id == '2':
+            raise CommunicationError("down")
+        return 'E' if delivery_id == '1' else 'S'
+
+    fake_sap.handler = handler
+    service = SAPService()
+
+    results = service.update_delivery_statuses([
+        {'delivery_id': '0', 'status': 'A'},
+        {'delivery_id': '1', 'status': 'A'},
+        {'delivery_id': '2', 'status': 'A'},
+        {'delivery_id': '3', 'status': 'A'}
+    ])
+
+    assert results == {
+        '0': None,
+        '1': "SAP rejected status change",
+        '2': "down"
+    }
+    assert fake_sap.connections[0].closed
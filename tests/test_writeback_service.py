@@ -0,0 +1,287 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from src.config.settings import settings
+from src.services import sap_service as sap_module
+from src.services import writeback_service
+from src.services.sap_service import SAPService, CommunicationError
+from src.services.writeback_service import DeliveryStatusWriteBackQueue
+
+
+@pytest.fixture
+def make_queue(tmp_path, fake_sap, writeback_settings):
+    queues = []
+
+    def make():
+        queue = DeliveryStatusWriteBackQueue(SAPService(), str(tmp_path / "queue.db"))
+        queues.append(queue)
+        return queue
+
+    yield make
+
+    fake_sap.handler = lambda delivery_id, status: 'S'
+    for queue in queues:
+        asyncio.run(queue.stop())
+
+
+@pytest.fixture
+def queue(make_queue):
+    return make_queue()
+
+
+def get_row(queue, delivery_id):
+    return queue._db.execute(
+        "SELECT * FROM delivery_status_updates WHERE delivery_id = ?",
+        (delivery_id,)
+    ).fetchone()
+
+
+def test_enqueue_coalesces_repeat_updates(queue, fake_sap):
+    first = queue.enqueue('1', 'A')
+    second = queue.enqueue('1', 'B')
+
+    assert first['coalesced'] is False
+    assert second['coalesced'] is True
+    assert second['status'] == 'B'
+    assert queue.get_stats()['pending'] == 1
+
+    result = asyncio.run(queue.flush())
+
+    assert result['batched'] == 1
+    assert result['succeeded'] == 1
+    assert fake_sap.calls == [('1', 'B')]
+    assert queue.get_stats()['pending'] == 0
+
+
+def test_update_requeued_during_send_is_kept(queue, fake_sap):
+    def handler(delivery_id, status):
+        if status == 'A':
+            queue.enqueue(delivery_id, 'B')
+        return 'S'
+
+    fake_sap.handler = handler
+    queue.enqueue('1', 'A')
+
+    asyncio.run(queue.flush())
+
+    row = get_row(queue, '1')
+    assert row['status'] == 'B'
+    assert row['version'] == 2
+    assert row['claimed_by'] is None
+
+    asyncio.run(queue.flush())
+
+    assert fake_sap.calls == [('1', 'A'), ('1', 'B')]
+    assert get_row(queue, '1') is None
+
+
+def test_failed_update_backs_off_exponentially(queue, fake_sap, monkeypatch):
+    monkeypatch.setattr(writeback_service.random, "uniform", lambda a, b: 0)
+    queue.backoff_base = 2.0
+    queue.backoff_max = 5.0
+
+    assert [queue._backoff(attempts) for attempts in (1, 2, 3, 4)] == [2.0, 4.0, 5.0, 5.0]
+
+    fake_sap.handler = lambda delivery_id, status: 'E'
+    queue.enqueue('1', 'A')
+    before = time.time()
+    result = asyncio.run(queue.flush())
+
+    row = get_row(queue, '1')
+    assert result['failed'] == 1
+    assert row['attempts'] == 1
+    assert row['last_error'] == "SAP rejected status change"
+    assert before + 2.0 <= row['next_attempt_at'] <= time.time() + 2.0
+    assert asyncio.run(queue.flush())['batched'] == 0
+
+
+def test_update_dead_lettered_after_max_retries(queue, fake_sap):
+    fake_sap.handler = lambda delivery_id, status: 'E'
+    queue.enqueue('1', 'A')
+
+    for _ in range(3):
+        asyncio.run(queue.flush())
+
+    stats = queue.get_stats()
+    assert stats['pending'] == 0
+    assert stats['failed'] == 1
+    assert [update['attempts'] for update in queue.get_failed_updates()] == [3]
+    assert asyncio.run(queue.flush())['batched'] == 0
+    assert len(fake_sap.calls) == 3
+
+
+def test_enqueue_revives_dead_lettered_update(queue, fake_sap):
+    fake_sap.handler = lambda delivery_id, status: 'E'
+    queue.enqueue('1', 'A')
+    for _ in range(3):
+        asyncio.run(queue.flush())
+
+    fake_sap.handler = lambda delivery_id, status: 'S'
+    ack = queue.enqueue('1', 'B')
+
+    assert ack['coalesced'] is False
+    assert queue.get_stats()['failed'] == 0
+    assert get_row(queue, '1')['attempts'] == 0
+
+    asyncio.run(queue.flush())
+
+    assert fake_sap.calls[-1] == ('1', 'B')
+    assert queue.get_stats()['pending'] == 0
+
+
+def test_requeue_failed_revives_dead_lettered_updates(queue, fake_sap):
+    fake_sap.handler = lambda delivery_id, status: 'E'
+    queue.enqueue_many([{'delivery_id': str(i), 'status': 'A'} for i in (1, 2)])
+    for _ in range(3):
+        asyncio.run(queue.flush())
+
+    assert queue.requeue_failed(['1']) == 1
+    assert queue.get_stats()['failed'] == 1
+    assert queue.requeue_failed() == 1
+    assert queue.get_stats()['failed'] == 0
+
+    fake_sap.handler = lambda delivery_id, status: 'S'
+    asyncio.run(queue.flush())
+
+    assert queue.get_stats()['pending'] == 0
+
+
+def test_sap_outage_leaves_updates_pending(queue, fake_sap, monkeypatch):
+    def refuse(**params):
+        raise CommunicationError("connection refused")
+
+    monkeypatch.setattr(sap_module, "Connection", refuse)
+    queue.enqueue_many([{'delivery_id': str(i), 'status': 'A'} for i in range(10)])
+
+    for _ in range(5):
+        result = asyncio.run(queue.flush())
+
+    stats = queue.get_stats()
+    assert result['unavailable'] == 10
+    assert result['error'] == "Failed to connect to SAP: connection refused"
+    assert (stats['pending'], stats['retrying'], stats['failed']) == (10, 0, 0)
+
+    monkeypatch.setattr(sap_module, "Connection", fake_sap.connect)
+    asyncio.run(queue.flush())
+
+    assert queue.get_stats()['pending'] == 0
+
+
+def test_communication_error_keeps_partial_results(make_queue, fake_sap, monkeypatch):
+    monkeypatch.setattr(settings, "SAP_POOL_SIZE", 1)
+    queue = make_queue()
+
+    def handler(delivery_id, status):
+        if len(fake_sap.calls) == 2:
+            raise CommunicationError("down")
+        return 'S'
+
+    fake_sap.handler = handler
+    queue.enqueue_many([{'delivery_id': str(i), 'status': 'A'} for i in (1, 2, 3)])
+
+    result = asyncio.run(queue.flush())
+
+    assert (result['batched'], result['sent'], result['succeeded'], result['failed']) == (3, 2, 1, 1)
+    accepted, dropped = [delivery_id for delivery_id, _ in fake_sap.calls]
+    unsent = ({'1', '2', '3'} - {accepted, dropped}).pop()
+
+    assert get_row(queue, accepted) is None
+    assert get_row(queue, dropped)['attempts'] == 1
+    assert get_row(queue, dropped)['last_error'] == "down"
+    assert get_row(queue, unsent)['attempts'] == 0
+    assert get_row(queue, unsent)['last_error'] is None
+    assert fake_sap.connections[0].closed
+
+    asyncio.run(queue.flush())
+
+    assert queue.get_stats()['pending'] == 0
+    assert len(fake_sap.connections) == 2
+
+
+def test_claimed_rows_are_skipped_by_other_queues(make_queue, fake_sap):
+    queue = make_queue()
+    other = make_queue()
+    other_results = []
+
+    def handler(delivery_id, status):
+        other_results.append(asyncio.run(other.flush()))
+        return 'S'
+
+    fake_sap.handler = handler
+    queue.enqueue('1', 'A')
+
+    asyncio.run(queue.flush())
+
+    assert [result['batched'] for result in other_results] == [0]
+    assert fake_sap.calls == [('1', 'A')]
+
+
+def test_flush_error_is_reported(queue):
+    async def broken_flush():
+        raise sqlite3.OperationalError("database is locked")
+
+    async def run():
+        queue.flush = broken_flush
+        queue.start()
+        await asyncio.sleep(0.1)
+        stats = queue.get_stats()
+        del queue.flush
+        await queue.stop()
+        return stats
+
+    stats = asyncio.run(run())
+
+    assert stats['running'] is True
+    assert stats['last_flush_error']['error'] == "OperationalError: database is locked"
+
+
+def test_enqueue_from_thread_wakes_flusher(queue, fake_sap):
+    queue.batch_size = 2
+    queue.flush_interval = 10
+
+    async def run():
+        queue.start()
+        await asyncio.sleep(0.05)
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            queue.enqueue_many,
+            [{'delivery_id': str(i), 'status': 'A'} for i in (1, 2)]
+        )
+        await asyncio.sleep(0.2)
+        calls = list(fake_sap.calls)
+        await queue.stop()
+        return calls
+
+    assert sorted(asyncio.run(run())) == [('1', 'A'), ('2', 'A')]
+
+
+def test_stop_waits_for_in_flight_batch(queue, fake_sap):
+    started = threading.Event()
+
+    def handler(delivery_id, status):
+        started.set()
+        time.sleep(0.2)
+        return 'S'
+
+    fake_sap.handler = handler
+    queue.enqueue_many([{'delivery_id': str(i), 'status': 'A'} for i in range(4)])
+
+    async def run():
+        queue.start()
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        await queue.stop()
+        return len(fake_sap.calls)
+
+    calls_when_stopped = asyncio.run(run())
+
+    # Cancelling would leave the in-flight rows claimed and unrecorded
+    remaining = sqlite3.connect(queue.path).execute(
+        "SELECT COUNT(*) FROM delivery_status_updates"
+    ).fetchone()[0]
+    assert remaining == 0
+    assert calls_when_stopped == 4
+    assert sorted(fake_sap.calls) == [(str(i), 'A') for i in range(4)]